@@ -98,24 +98,13 @@ def __get_subchunk2_size(num_samples:int, bit_depth:int, num_channels:int):
     size = int(num_samples * num_channels * (bit_depth // 8))
     return size, __make_uint32(size)
 
-def __create_from_samples(sample_rate:int, fmt:SampleFormat, num_channels:int, samples_by_channel:list):
-    num_samples = -1
-    
+def create_header(sample_rate:int, fmt:SampleFormat, num_channels:int, num_samples:int) -> bytearray:
     # Testing arguments
     if sample_rate < 1 or sample_rate >= 2**32:
         raise Exception("Sample rate must be at least 1 sample per second.")
     if num_channels < 1 or num_channels >= 2**16:
         raise Exception("Number of channels must be positive and less than 65536.")
-    if len(samples_by_channel) != num_channels:
-        raise Exception("Samples must be provided for each channel.")
-    else:
-        for channel_samples in samples_by_channel:
-            num_samples_in_channel = len(channel_samples)
-            if num_samples == -1:
-                num_samples = num_samples_in_channel
-            elif num_samples_in_channel != num_samples:
-                raise Exception("Each channel must have the same number of samples.")
-    
+
     file_bytes = bytearray()
     
     # ChunkID
@@ -168,6 +157,25 @@ def __create_from_samples(sample_rate:int, fmt:SampleFormat, num_channels:int, s
     # SubChunk2Size (determined above)
     file_bytes.extend(subchunk2_size_bytes)
 
+    return file_bytes
+
+def __create_from_samples(sample_rate:int, fmt:SampleFormat, num_channels:int, samples_by_channel:list):
+    num_samples = -1
+    
+    # Testing arguments
+    if len(samples_by_channel) != num_channels:
+        raise Exception("Samples must be provided for each channel.")
+    else:
+        for channel_samples in samples_by_channel:
+            num_samples_in_channel = len(channel_samples)
+            if num_samples == -1:
+                num_samples = num_samples_in_channel
+            elif num_samples_in_channel != num_samples:
+                raise Exception("Each channel must have the same number of samples.")
+    
+    file_bytes = create_header(sample_rate, fmt, num_channels, num_samples)
+    subchunk2_size, _ = __get_subchunk2_size(num_samples, fmt.bit_depth, num_channels)
+
     # Data
     for sample_index in range(num_samples):
         for channel_index in range(num_channels):
@@ -189,4 +197,32 @@ def create_from_samples_mono(sample_rate:int, fmt:SampleFormat, samples:list) ->
     return __create_from_samples(sample_rate, fmt, 1, [samples])
 
 def create_from_samples_stereo(sample_rate:int, fmt:SampleFormat, left_samples:list, right_samples:list) -> bytearray:
-    return __create_from_samples(sample_rate, fmt, 2, [left_samples, right_samples])
\ No newline at end of file
+    return __create_from_samples(sample_rate, fmt, 2, [left_samples, right_samples])
+
+class WaveStreamWriter:
+    # Writes a mono WAV file one block of samples at a time, so the whole song never has to be held in memory.
+    # The header is written with a length of zero up front and patched by finish() once the length is known.
+
+    def __init__(self, file, sample_rate:int, fmt:SampleFormat):
+        self.__file = file
+        self.__sample_rate = sample_rate
+        self.__fmt = fmt
+        self.num_samples = 0
+
+        self.__file.write(create_header(sample_rate, fmt, 1, 0))
+
+    def write_encoded_samples(self, sample_bytes:bytes):
+        # Samples already encoded with this writer's SampleFormat are written as-is.
+        self.__file.write(sample_bytes)
+        self.num_samples += len(sample_bytes) // (self.__fmt.bit_depth // 8)
+
+    def finish(self):
+        subchunk2_size = self.num_samples * (self.__fmt.bit_depth // 8)
+
+        # Conditional padding byte if SubChunk2Size is odd.
+        if subchunk2_size % 2 == 1:
+            self.__file.write(b"\x00")
+
+        self.__file.seek(0)
+        self.__file.write(create_header(self.__sample_rate, self.__fmt, 1, self.num_samples))
+        self.__file.seek(0, 2)
\ No newline at end of file
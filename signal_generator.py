@@ -1,42 +1,73 @@
 # signal_generator.py
 
 # Generate floating-point samples of a waveform. A synthesizer.
+# Blocks of samples can also be generated already encoded as bytes in an output sample format.
+
+import math
 
 class SignalGenerator:
     def __init__(self, sample_rate:int, freq:float):
         self._sample_rate:int
         self._freq:float
 
-        self.__samples_elapsed:int
+        # Position within the current wave cycle (0 to 1) and how far it moves per sample.
+        self.__phase:float
+        self._phase_inc:float
 
-        self.set_sample_rate(sample_rate)
+        self._sample_rate = sample_rate
         self.set_freq(freq)
+        self.reset()
     
     def next_sample(self) -> float:
-        # Get current waveform time.
-        time = self.__samples_elapsed / self._sample_rate
-        wave_position = time * self._freq % 1
-        
         # Subclass handles sample generation
-        sample = self._next_sample_internal(wave_position)
+        sample = self._next_sample_internal(self.__phase)
 
-        # Progress time.
-        self.__samples_elapsed += 1
+        # Progress time, wrapping back into the current cycle.
+        phase = self.__phase + self._phase_inc
+        self.__phase = phase - int(phase)
 
         return sample
 
+    def next_block(self, num_samples:int, encode) -> bytearray:
+        # encode(sample) converts one floating-point sample into the bytes of the output sample format.
+        block = bytearray(num_samples * len(encode(0.0)))
+        self.next_block_into(memoryview(block), num_samples, encode)
+        return block
+
+    def next_block_into(self, out:memoryview, num_samples:int, encode):
+        # Same as next_block, but writes the encoded samples into an existing buffer of exactly the right size.
+        # Subclass handles block generation
+        self._next_block_internal(out, self.__phase, num_samples, encode)
+
+        # Progress time.
+        phase = self.__phase + num_samples * self._phase_inc
+        self.__phase = phase - int(phase)
+
     def _next_sample_internal(self, wave_position:float) -> float:
         return 0.0
 
+    def _next_block_internal(self, out:memoryview, start_phase:float, num_samples:int, encode):
+        # Generic fallback: one sample at a time. Subclasses should override this with something faster.
+        phase = start_phase
+        byte_index = 0
+        for _ in range(num_samples):
+            sample_bytes = encode(self._next_sample_internal(phase))
+            out[byte_index : byte_index + len(sample_bytes)] = sample_bytes
+            byte_index += len(sample_bytes)
+            phase += self._phase_inc
+            phase -= int(phase)
+
     def set_freq(self, freq:float):
         self._freq = freq
+        self._phase_inc = freq / self._sample_rate
 
     def set_sample_rate(self, sample_rate:int):
         self._sample_rate = sample_rate
+        self._phase_inc = self._freq / sample_rate
         self.reset()
 
     def reset(self):
-        self.__samples_elapsed = 0
+        self.__phase = 0.0
 
 class PulseGenerator(SignalGenerator):
     def __init__(self, sample_rate:int, freq:float, pulse_percent:float):
@@ -44,4 +75,36 @@ class PulseGenerator(SignalGenerator):
         super().__init__(sample_rate, freq)
 
     def _next_sample_internal(self, wave_position:float) -> float:
-        return 1 if wave_position < self._pulse_percent else -1
\ No newline at end of file
+        return 1 if wave_position < self._pulse_percent else -1
+
+    def _next_block_internal(self, out:memoryview, start_phase:float, num_samples:int, encode):
+        _pulse_block(out, start_phase, num_samples, self._phase_inc, self._pulse_percent, encode(1), encode(-1))
+
+def _pulse_block(out:memoryview, start_phase:float, num_samples:int, phase_inc:float, pulse_percent:float, high:bytes, low:bytes):
+    # A pulse wave is only ever high or low, so the block is written as alternating runs of the two
+    # encoded samples (one C-level bytes repeat per run) instead of one sample at a time.
+    # Kept as a plain function of its arguments so the per-cycle loop only touches locals.
+    ceil = math.ceil
+    width = len(high)
+
+    # Sample i of the block has phase (start_phase + i * phase_inc), so the edges of each cycle
+    # can be found directly instead of wrapping the phase for every sample.
+    sample_index = 0
+    cycle = 0
+
+    while sample_index < num_samples:
+        # High from the start of the cycle until the pulse width is reached, then low until the next cycle.
+        fall_index = ceil((cycle + pulse_percent - start_phase) / phase_inc)
+        if fall_index > num_samples:
+            fall_index = num_samples
+        if fall_index > sample_index:
+            out[sample_index * width : fall_index * width] = high * (fall_index - sample_index)
+            sample_index = fall_index
+
+        cycle += 1
+        rise_index = ceil((cycle - start_phase) / phase_inc)
+        if rise_index > num_samples:
+            rise_index = num_samples
+        if rise_index > sample_index:
+            out[sample_index * width : rise_index * width] = low * (rise_index - sample_index)
+            sample_index = rise_index
\ No newline at end of file
@@ -2,6 +2,7 @@
 
 # Text File Synth. Create an audio file from commands in a .TXT file.
 
+import os
 import sys
 from tfs_env import TFSEnvironment
 from tfs_script import Scanner
@@ -46,7 +47,7 @@ def __console_program():
     SAMPLE_RATE = 44100
     FORMAT = pywav.SampleFormat.int_fmt(8)
 
-    env = TFSEnvironment(SAMPLE_RATE)
+    env = TFSEnvironment(SAMPLE_RATE, FORMAT)
     env.set_bpm(160)
 
     # Parse input.
@@ -59,20 +60,34 @@ def __console_program():
     # Successful scan and parse.
     print("File scanned and parsed successfully.")
 
-    # If output path is specified and valid, output to it.
+    # If output path is specified and valid, render the song into it. Samples are streamed into the file as they are generated.
     if output_path != "":
+        created_output = not os.path.exists(output_path)
+        opened_output = False
         try:
             with open(output_path, "wb") as f:
-                f.write(pywav.create_from_samples_mono(SAMPLE_RATE, FORMAT, parser.samples))
-                f.flush()
+                opened_output = True
+                writer = pywav.WaveStreamWriter(f, SAMPLE_RATE, FORMAT)
+                env.render(parser.note_nums, parser.note_lengths, writer.write_encoded_samples)
+                writer.finish()
                 print(f"Output was placed at \"{output_path}\"")
         except OSError as e:
             print(f"Unable to write to output file at \"{output_path}\": {e}")
+            __remove_partial_output(output_path, opened_output and created_output)
             exit(53)
         except Exception as e:
             print(f"Unexpected exception: {e}")
+            __remove_partial_output(output_path, opened_output and created_output)
             exit(54)
     else:
         print("No output file specified.")
 
+def __remove_partial_output(output_path:str, created_by_this_run:bool):
+    # Only clean up a half-written file that didn't exist before this run. Never delete a file that was already there.
+    if created_by_this_run:
+        try:
+            os.remove(output_path)
+        except OSError:
+            pass
+
 __console_program()
\ No newline at end of file
@@ -2,46 +2,118 @@
 
 # Text File Synth environment functions
 
+from array import array
+from itertools import groupby
 import signal_generator
+import pywav
 
 class TFSEnvironment:
+    # Note number used in a note schedule to mark a rest. Lower than any playable note.
+    REST_NOTE_NUM = -2**15
+
     __sample_rate = 44100
     __synth:signal_generator.SignalGenerator
 
     __bpm = 120.0
     __gain = 0.25
 
-    def __init__(self, sample_rate:int):
+    # Length of one 4/4 measure (4 beats) in samples at the current sample rate and BPM.
+    __samples_per_measure:int
+
+    def __init__(self, sample_rate:int, fmt:pywav.SampleFormat):
         # No checks here.
         self.__sample_rate = sample_rate
+        self.__fmt = fmt
         self.__synth = signal_generator.PulseGenerator(sample_rate, 440, 0.125)
 
+        # Samples are produced already encoded in the output format. Silence is the same every time.
+        self.__silence = fmt.format(0.0)
+        self.__recompute_timing()
+
     def set_bpm(self, bpm:float):
         if bpm > 0:
             self.__bpm = bpm
+            self.__recompute_timing()
+
+    def __recompute_timing(self):
+        # (sample rate) * (seconds per beat) * (4 beats per measure), truncated once here so each note is integer math.
+        self.__samples_per_measure = int(self.__sample_rate * 240 / self.__bpm)
 
     def set_gain(self, gain:float):
         if gain in range(0, 1):
             self.__gain = gain
 
-    def __get_freq(note_num:int):
+    def __calc_freq(note_num:int):
         # MIDI tuning standard from Wikipedia, baby!
-        # Use a look-up table if needed.
         return 2**((note_num - 69) / 12) * 440.0
 
-    def __get_num_samples(sample_rate:int, bpm:float, beat_divisor:int, duration:int):
-        
-        # Length of note in samples is: (sample rate) * (seconds per beat) * (the fraction of a beat to play)
-        # For example, 3 16th notes in length (dotted eighth) at 120 BPM in a 44100 Hz environment would be: (44100) * (0.5 [60/120]) * (3/4) = 16537.5 samples (always truncate)
-        return int(sample_rate * (60 / bpm) * (duration / beat_divisor)) * 4
+    # Frequencies for every MIDI note number, computed once.
+    __FREQ_TABLE = tuple(map(__calc_freq, range(128)))
+
+    def __get_freq(note_num:int):
+        if 0 <= note_num < 128:
+            return TFSEnvironment.__FREQ_TABLE[note_num]
+        # Flats on the lowest octave fall just outside the MIDI range.
+        return TFSEnvironment.__calc_freq(note_num)
+
+    def __encode(self, sample:float) -> bytes:
+        return self.__fmt.format(sample * self.__gain)
 
-    def note(self, note_num:int, beat_divisor:int, duration:int):
+    def get_num_samples(self, beat_divisor:int, duration:int) -> int:
+        # Length of note in samples is: (samples per measure) * (the fraction of a measure to play)
+        # For example, 3 16th notes in length (dotted eighth) at 120 BPM in a 44100 Hz environment would be: (88200) * (3/16) = 16537.5 samples (always truncate)
+        return self.__samples_per_measure * duration // beat_divisor
+
+    def note(self, note_num:int, num_samples:int):
         freq = TFSEnvironment.__get_freq(note_num)
         self.__synth.set_freq(freq)
         
-        num_samples = TFSEnvironment.__get_num_samples(self.__sample_rate, self.__bpm, beat_divisor, duration)
-        return [self.__synth.next_sample() * self.__gain for _ in range(num_samples)]
+        return self.__synth.next_block(num_samples, self.__encode)
+
+    def rest(self, num_samples:int):
+        # A rest is a single repeat of the pre-encoded silent sample. render_to_buffer doesn't need this, since its buffer starts out silent.
+        return self.__silence * num_samples
+
+    def __note_runs(note_nums:array, note_lengths:array):
+        # Merge consecutive notes of the same pitch (or consecutive rests) into one longer note.
+        # The oscillator's phase carries over from note to note, so a run of the same pitch sounds the same as
+        # a single note of the combined length, with one oscillator call instead of one per note. The samples are
+        # identical up to floating-point rounding: the run's cycle edges are found from one starting phase instead of
+        # re-wrapping the phase at each note boundary, which can occasionally move an edge by one sample.
+        for note_num, run in groupby(zip(note_nums, note_lengths), key=lambda note : note[0]):
+            yield note_num, sum(num_samples for _, num_samples in run)
+
+    def render_to_buffer(self, note_nums:array, note_lengths:array) -> bytearray:
+        # Render a whole note schedule into one buffer. The schedule gives the total length up front,
+        # so the buffer is allocated once and every note is written into its own slice of it.
+        # The buffer starts out filled with silence, so rests are already in place and only move the cursor.
+        width = self.__fmt.bit_depth // 8
+        buffer = bytearray(self.__silence) * sum(note_lengths)
+        view = memoryview(buffer)
+
+        REST_NOTE_NUM = TFSEnvironment.REST_NOTE_NUM
+        synth = self.__synth
+        encode = self.__encode
+        cursor = 0
+
+        for note_num, num_samples in TFSEnvironment.__note_runs(note_nums, note_lengths):
+            end = cursor + num_samples * width
+            if note_num != REST_NOTE_NUM:
+                synth.set_freq(TFSEnvironment.__get_freq(note_num))
+                synth.next_block_into(view[cursor:end], num_samples, encode)
+            cursor = end
+
+        return buffer
+
+    def render(self, note_nums:array, note_lengths:array, sample_sink):
+        # Render a whole note schedule (parallel arrays of note numbers and lengths in samples) in one loop,
+        # handing each block of samples to the sink in order. Consecutive notes of the same pitch are handed over as one block.
+        REST_NOTE_NUM = TFSEnvironment.REST_NOTE_NUM
+        note = self.note
+        rest = self.rest
 
-    def rest(self, beat_divisor:int, duration:int):
-        num_samples = TFSEnvironment.__get_num_samples(self.__sample_rate, self.__bpm, beat_divisor, duration)
-        return [0.0 for _ in range(num_samples)]
\ No newline at end of file
+        for note_num, num_samples in TFSEnvironment.__note_runs(note_nums, note_lengths):
+            if note_num == REST_NOTE_NUM:
+                sample_sink(rest(num_samples))
+            else:
+                sample_sink(note(note_num, num_samples))
\ No newline at end of file
@@ -11,29 +11,40 @@
 # < or > = octave down or up
 # @ followed by number = new BPM
 
+import re
+from array import array
 from tfs_env import TFSEnvironment
 
-class TokenType:
-    def __init__(self, disp_name:str):
-        self.disp_name = disp_name
-
-    def __str__(self):
-        return f"TokenType({self.disp_name})"
-    
-    def __repr__(self) -> str:
-        return self.__str__()
-
-NOTE_LETTER = TokenType("Note Letter")
-REST = TokenType("Rest")
-NUMBER = TokenType("Number")
-LENGTH_EXT = TokenType("Length Extension")
-SHARP = TokenType("Sharp")
-FLAT = TokenType("Flat")
-OCT_UP = TokenType("Octave Up")
-OCT_DN = TokenType("Octave Down")
-BPM_CHANGE = TokenType("BPM Change")
+# Token types. Tokens are stored as plain integers (see TokenList), so each type is just an ID.
+NOTE_LETTER = 0
+REST = 1
+NUMBER = 2
+LENGTH_EXT = 3
+SHARP = 4
+FLAT = 5
+OCT_UP = 6
+OCT_DN = 7
+BPM_CHANGE = 8
+
+# Note letters, in the order of their token values.
+NOTE_LETTERS = "abcdefg"
+
+# Display names, indexed by token type.
+TOKEN_TYPE_NAMES = (
+    "Note Letter",
+    "Rest",
+    "Number",
+    "Length Extension",
+    "Sharp",
+    "Flat",
+    "Octave Up",
+    "Octave Down",
+    "BPM Change",
+)
 
 class ScriptIndex:
+    __slots__ = ('line_num', 'column_num')
+
     def __init__(self, line:int, column:int) -> None:
         self.line_num = line
         self.column_num = column
@@ -44,43 +55,95 @@ class ScriptIndex:
         return self.__str__()
         
 class Token:
+    # A single token rebuilt from a TokenList, for display and debugging.
+    __slots__ = ('script_index', 'raw_script', 'token_type', 'value')
 
-    def __init__(self):
-        self.script_index:ScriptIndex
-        self.raw_script:str
-        self.token_type:TokenType
-        self.value:object
+    def __init__(self, script_index:ScriptIndex, raw_script:str, token_type:int, value:int):
+        self.script_index = script_index
+        self.raw_script = raw_script
+        self.token_type = token_type
+        self.value = value
 
     def __str__(self) -> str:
-        return f"Token(\"{self.token_type.disp_name}\", {self.raw_script})@{self.script_index}"
+        return f"Token(\"{TOKEN_TYPE_NAMES[self.token_type]}\", {self.raw_script})@{self.script_index}"
 
     def __repr__(self) -> str:
         return self.__str__()
 
-class Parser:
-    __NOTE_NUM_OFFSETS = {
-        'a': 9,
-        'b': 11,
-        'c': 0,
-        'd': 2,
-        'e': 4,
-        'f': 5,
-        'g': 7,
+class TokenList:
+    # Scanned tokens, stored as parallel arrays (one entry per token) instead of a list of Token objects.
+    # Values are: the note letter's index in NOTE_LETTERS, a number's value, or a length extension's tilde count. Other tokens have 0.
+
+    __SYMBOLS = {
+        REST: "_",
+        SHARP: "+",
+        FLAT: "-",
+        OCT_UP: ">",
+        OCT_DN: "<",
+        BPM_CHANGE: "@",
     }
+
+    # Largest value that fits in the value array.
+    MAX_VALUE = 2**31 - 1
+
+    def __init__(self):
+        self.types = array('b')
+        self.values = array('i')
+        self.lines = array('i')
+        self.columns = array('i')
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __iter__(self):
+        return (self.get(i) for i in range(len(self)))
+
+    def append(self, token_type:int, value:int, line:int, column:int):
+        self.types.append(token_type)
+        self.values.append(value)
+        self.lines.append(line)
+        self.columns.append(column)
+
+    def script_index(self, i:int) -> ScriptIndex:
+        return ScriptIndex(self.lines[i], self.columns[i])
+
+    def get(self, i:int) -> Token:
+        token_type = self.types[i]
+        value = self.values[i]
+
+        if token_type == NOTE_LETTER:
+            raw_script = NOTE_LETTERS[value]
+        elif token_type == NUMBER:
+            raw_script = str(value)
+        elif token_type == LENGTH_EXT:
+            raw_script = "~" * value
+        else:
+            raw_script = TokenList.__SYMBOLS[token_type]
+
+        return Token(self.script_index(i), raw_script, token_type, value)
+
+class Parser:
+    # Semitones above C for each note letter, indexed by the note letter token's value (a, b, c, d, e, f, g).
+    __NOTE_NUM_OFFSETS = (9, 11, 0, 2, 4, 5, 7)
     
     MAX_OCTAVE = 9
     MIN_OCTAVE = 0
 
-    def __init__(self, tokens:list, environment:TFSEnvironment):
+    def __init__(self, tokens:TokenList, environment:TFSEnvironment):
         self.__env = environment
         self.__tokens = tokens
+        self.__types = tokens.types
+        self.__values = tokens.values
         self.error_msg = "Incomplete"
 
         self.__octave = 5
 
         self.__current = 0
 
-        self.samples = []
+        # Note schedule: the note number (or TFSEnvironment.REST_NOTE_NUM) and length in samples of every note, in order.
+        # Render it with TFSEnvironment.render or TFSEnvironment.render_to_buffer once parsing succeeds.
+        self.note_nums = array('h')
+        self.note_lengths = array('q')
 
         self.success = self.__try_parse_tokens()
 
@@ -93,21 +156,24 @@ class Parser:
         return True
 
     def __parse_next_token(self) -> bool:
-        t = self.__advance()
+        # Tokens are referred to by their index in the token list.
+        t = self.__current
+        self.__current += 1
+        token_type = self.__types[t]
 
-        if t.token_type == NOTE_LETTER:
+        if token_type == NOTE_LETTER:
             if not self.__note(t):
                 return False
-        elif t.token_type == REST:
+        elif token_type == REST:
             if not self.__rest(t):
                 return False
-        elif t.token_type in {OCT_UP, OCT_DN}:
+        elif token_type == OCT_UP or token_type == OCT_DN:
             self.__octave_change(t)
-        elif t.token_type == BPM_CHANGE:
+        elif token_type == BPM_CHANGE:
             if not self.__bpm_change(t):
                 return False
         else:
-            return self.__error(f"Unexpected token at {t.script_index}: {t.token_type.disp_name} (Expected: Note, rest, octave change, or BPM change)")
+            return self.__error(f"Unexpected token at {self.__tokens.script_index(t)}: {TOKEN_TYPE_NAMES[token_type]} (Expected: Note, rest, octave change, or BPM change)")
         
         return True
 
@@ -116,241 +182,219 @@ class Parser:
         return False
 
     def __is_at_end(self) -> bool:
-        return self.__current >= len(self.__tokens)
-
-    def __advance(self) -> Token:
-        self.__current += 1
-        return self.__tokens[self.__current - 1]
-
-    def __try_peek(self):
-        if self.__current < len(self.__tokens):
-            return True, self.__tokens[self.__current]
-        return False, None
-
-    def __optional_param(self, expected_type:TokenType):
-        found, token = self.__try_peek()
-        if found and token.token_type == expected_type:
-            self.__advance()
-            return True, token
-        return False, None
-    
-    def __required_param(self, preceeding_token:Token, expected_type:TokenType):
-        found, token = self.__try_peek()
-        if found:
-            if token.token_type == expected_type:
-                self.__advance()
-                return True, token
-            else:
-                self.error_msg = f"Unexpected token after {preceeding_token.token_type.disp_name} at {preceeding_token.script_index}: {token.token_type.disp_name} (Expected: {expected_type.disp_name})"
-                return False, token
+        return self.__current >= len(self.__types)
+
+    def __param_error(self, preceeding_token:int, expected_type:int) -> False:
+        # A required parameter was not found at the current token.
+        preceeding_name = TOKEN_TYPE_NAMES[self.__types[preceeding_token]]
+        preceeding_index = self.__tokens.script_index(preceeding_token)
+        if self.__current < len(self.__types):
+            found_name = TOKEN_TYPE_NAMES[self.__types[self.__current]]
+            return self.__error(f"Unexpected token after {preceeding_name} at {preceeding_index}: {found_name} (Expected: {TOKEN_TYPE_NAMES[expected_type]})")
         else:
-            self.error_msg = f"Missing token after {preceeding_token.token_type.disp_name} at {preceeding_token.script_index}. Expected: {expected_type.disp_name}"
-            return False, None
+            return self.__error(f"Missing token after {preceeding_name} at {preceeding_index}. Expected: {TOKEN_TYPE_NAMES[expected_type]}")
 
-    def __note(self, note_letter_token:Token) -> bool:
-        note_num = 69
-        divisor = 1
-        duration = 1
+    # The note, note length, and BPM change parsers look ahead with a local token index (i) rather than
+    # peek/advance calls, and only store it back to self.__current once they are done.
 
-        # Parse note letter.
-        note_letter = str(note_letter_token.value)
-        if note_letter in Parser.__NOTE_NUM_OFFSETS.keys():
-            note_num = (self.__octave * 12) + Parser.__NOTE_NUM_OFFSETS[note_letter]
-        else:
-            return self.__error(f"Unrecognized note letter at {note_letter_token.script_index}: {note_letter}")
+    def __note(self, note_letter_token:int) -> bool:
+        types = self.__types
+        i = self.__current
+        n = len(types)
+
+        # Parse note letter. The scanner only produces valid note letters.
+        note_num = (self.__octave * 12) + Parser.__NOTE_NUM_OFFSETS[self.__values[note_letter_token]]
         
         # Parse sharp or flat.
-        found, _ = self.__optional_param(SHARP)
-        if found:
+        if i < n and types[i] == SHARP:
             note_num += 1
-        else:
-            found, _ = self.__optional_param(FLAT)
-            if found:
-                note_num -= 1
+            i += 1
+        elif i < n and types[i] == FLAT:
+            note_num -= 1
+            i += 1
 
-        # Parse measure divisor.
-        found, measure_div_token = self.__required_param(note_letter_token, NUMBER)
+        self.__current = i
+
+        # Parse measure divisor and length extension.
+        found, num_samples = self.__note_length(note_letter_token)
         if not found:
             return False
-        
-        if measure_div_token.value > 0:
-            divisor = measure_div_token.value
-        else:
-            # Measure divisor must be greater than 0.
-            return self.__error(f"Measure divisor at {measure_div_token.script_index} must be greater than 0")
-        
-        # Parse length extension.
-        found, length_ext_token = self.__optional_param(LENGTH_EXT)
-        if found:
-            duration += length_ext_token.value
 
-        # Generate the samples.
-        self.samples.extend(self.__env.note(note_num, divisor, duration))
+        # Schedule the note.
+        self.note_nums.append(note_num)
+        self.note_lengths.append(num_samples)
 
         return True
     
-    def __rest(self, rest_token:Token) -> bool:
+    def __rest(self, rest_token:int) -> bool:
+        # Parse measure divisor and length extension.
+        found, num_samples = self.__note_length(rest_token)
+        if not found:
+            return False
+
+        # Schedule the rest.
+        self.note_nums.append(TFSEnvironment.REST_NOTE_NUM)
+        self.note_lengths.append(num_samples)
+
+        return True
+
+    def __note_length(self, preceeding_token:int):
+        # Shared by notes and rests: parse the measure divisor and optional length extension, and return the length in samples.
+        types = self.__types
+        values = self.__values
+        i = self.__current
+        n = len(types)
+
         divisor = 1
         duration = 1
 
-        # TODO: Consolidate this functionality with note letter functionality.
-
         # Parse measure divisor.
-        found, measure_div_token = self.__required_param(rest_token, NUMBER)
-        if not found:
-            return False
+        if i >= n or types[i] != NUMBER:
+            return self.__param_error(preceeding_token, NUMBER), 0
+        measure_div_token = i
+        i += 1
         
-        if measure_div_token.value > 0:
-            divisor = measure_div_token.value
+        if values[measure_div_token] > 0:
+            divisor = values[measure_div_token]
         else:
             # Measure divisor must be greater than 0.
-            return self.__error(f"Measure divisor at {measure_div_token.script_index} must be greater than 0")
+            return self.__error(f"Measure divisor at {self.__tokens.script_index(measure_div_token)} must be greater than 0"), 0
         
         # Parse length extension.
-        found, length_ext_token = self.__optional_param(LENGTH_EXT)
-        if found:
-            duration += Token(length_ext_token).value
+        if i < n and types[i] == LENGTH_EXT:
+            duration += values[i]
+            i += 1
 
-        # Generate the samples.
-        self.samples.extend(self.__env.rest(divisor, duration))
+        self.__current = i
 
-        return True
+        return True, self.__env.get_num_samples(divisor, duration)
 
-    def __octave_change(self, token:Token):
-        if token.token_type == OCT_UP:
+    def __octave_change(self, token:int):
+        if self.__types[token] == OCT_UP:
             # Raise the octave by one, respecting the max octave.
             self.__octave = min(self.MAX_OCTAVE, self.__octave + 1)
-        elif token.token_type == OCT_DN:
+        elif self.__types[token] == OCT_DN:
             # Lower the octave by one, respecting the min octave.
             self.__octave = max(self.MIN_OCTAVE, self.__octave - 1)
 
-    def __bpm_change(self, bpm_change_token:Token):
+    def __bpm_change(self, bpm_change_token:int):
+        types = self.__types
+        i = self.__current
+
         # Parse new BPM number.
-        found, bpm_num_token = self.__required_param(bpm_change_token, NUMBER)
-        if not found:
-            return False
+        if i >= len(types) or types[i] != NUMBER:
+            return self.__param_error(bpm_change_token, NUMBER)
+        bpm_num = self.__values[i]
+        self.__current = i + 1
         
-        if bpm_num_token.value > 0:
-            self.__env.set_bpm(bpm_num_token.value)
+        if bpm_num > 0:
+            self.__env.set_bpm(bpm_num)
         else:
-            return self.__error(f"BPM number at {bpm_num_token.script_index} must be greater than 0.")
+            return self.__error(f"BPM number at {self.__tokens.script_index(i)} must be greater than 0.")
         
         return True
 
+# Every token matches exactly one group. ERR catches any character that isn't part of the language.
+# Spaces, tabs, and a comment before a token are consumed as part of its match, so they are skipped by the regex engine
+# and never reach the scanner's Python code. A comment always runs to a line break or the end of the text, which NL or
+# END then match, so the engine never has to backtrack into the skipped text.
+# Groups are numbered in order, so match.lastindex says which one matched (see Scanner.__TOKEN_HANDLERS).
+_TOKEN_PATTERN = re.compile(r"""
+    [ \t]*(?:\#[^\r\n]*)?
+    (?:
+    (?P<NL>\r\n?|\n)
+    |(?P<NUM>[0-9]+)
+    |(?P<TIL>~+)
+    |(?P<CHAR>[a-g_+\-<>@])
+    |(?P<ERR>.)
+    |(?P<END>\Z)
+    )
+    """, re.VERBOSE)
+
+# Marks a character code that isn't a single-character token in _CHAR_TOKEN_TYPES.
+_NOT_A_CHAR_TOKEN = 0xFF
+
+def _build_char_token_tables():
+    types = bytearray([_NOT_A_CHAR_TOKEN]) * 128
+    values = bytearray(128)
+    for letter_index, c in enumerate(NOTE_LETTERS):
+        types[ord(c)] = NOTE_LETTER
+        values[ord(c)] = letter_index
+    for c, token_type in (('_', REST), ('+', SHARP), ('-', FLAT), ('>', OCT_UP), ('<', OCT_DN), ('@', BPM_CHANGE)):
+        types[ord(c)] = token_type
+    return bytes(types), bytes(values)
+
+# Token type and token value of every single-character token, indexed by character code.
+_CHAR_TOKEN_TYPES, _CHAR_TOKEN_VALUES = _build_char_token_tables()
+
 class Scanner:
     def __init__(self, text:str):
         self.__text = text
         self.error_msg = "Incomplete"
-        self.tokens = []
-        self.__current = 0
+        self.tokens = TokenList()
 
         self.__current_ln = 0
-        self.__current_col = 0
+        self.__line_start = 0
 
         self.success = self.__try_scan_tokens()
 
     def __try_scan_tokens(self):
-        while not self.__is_at_end():
-            self.__start_of_token = self.__current
-
-            if not self.__scan_next_token():
+        # The regex engine does the character-level work; this loop only sees whole tokens.
+        for match in _TOKEN_PATTERN.finditer(self.__text):
+            group = match.lastindex
+            if not Scanner.__TOKEN_HANDLERS[group](self, match.group(group), match.start(group)):
                 return False
         
         self.error_msg = "Text scanned successfully"
         return True
 
-    def __scan_next_token(self) -> bool:
-        c = self.__advance()
-
-        if c == ' ' or c == '\t':
-            pass
-        elif c in {'\r', '\n'}:
-            self.__newline(c)
-        elif c == '#':
-            self.__comment()
-        elif c == '~':
-            self.__tildes()
-        elif c == '_':
-            self.__add_token(REST, None)
-        elif c == '+':
-            self.__add_token(SHARP, None)
-        elif c == '-':
-            self.__add_token(FLAT, None)
-        elif c == '>':
-            self.__add_token(OCT_UP, None)
-        elif c == '<':
-            self.__add_token(OCT_DN, None)
-        elif c == '@':
-            self.__add_token(BPM_CHANGE, None)
-        elif c.isnumeric():
-            self.__number()
-        elif c in "abcdefg":
-            self.__add_token(NOTE_LETTER, c)
-        else:
-            self.error_msg = f"Unrecognized character at {ScriptIndex(self.__current_ln + 1, self.__current_col + 1)}: \'{c}\'"
-            return False
+    # Token handlers take the token's text and its position in the whole script text.
 
-        return True
+    def __script_index(self, start:int) -> ScriptIndex:
+        return ScriptIndex(self.__current_ln + 1, start - self.__line_start + 1)
 
-    def __is_at_end(self) -> bool:
-        return self.__current >= len(self.__text)
-
-    def __add_token(self, token_type, value:object):
-        token = Token()
-        token.raw_script = self.__get_substring()
-        token.script_index = ScriptIndex(self.__current_ln + 1, self.__current_col - len(token.raw_script) + 1)
-        token.token_type = token_type
-        token.value = value
-        
-        self.tokens.append(token)
+    def __add_token(self, start:int, token_type:int, value:int):
+        self.tokens.append(token_type, value, self.__current_ln + 1, start - self.__line_start + 1)
 
-    def __advance(self) -> str:
-        self.__current += 1
-        self.__current_col += 1
-        return self.__text[self.__current - 1]
-    
-    def __peek(self) -> str:
-        return self.__text[self.__current]
-    
-    def __get_substring(self) -> str:
-        return self.__text[self.__start_of_token : self.__current]
+    def __skip(self, text:str, start:int) -> bool:
+        return True
 
-    def __newline(self, c:str):
-        self.__current_col = 0
+    def __newline(self, text:str, start:int) -> bool:
         self.__current_ln += 1
+        self.__line_start = start + len(text)
+        return True
 
-        # Consume second control character if using Windows line endings.
-        if c == '\r' and self.__peek() == '\n':
-            self.__advance()
-
-    def __comment(self):
-        while not self.__is_at_end():
-            c = self.__advance()
-
-            # If newline, UNIX line ending
-            if c in {'\r', '\n'}:
-                self.__newline(c)
-                # Comment is complete.
-                break
-    
-    def __number(self):
-        while not self.__is_at_end():
-            c = self.__peek()
-
-            if not c.isnumeric():
-                break
-
-            self.__advance()
-
-        self.__add_token(NUMBER, int(self.__get_substring()))
+    def __number(self, text:str, start:int) -> bool:
+        value = int(text)
+        if value > TokenList.MAX_VALUE:
+            self.error_msg = f"Number at {self.__script_index(start)} is too large: {text}"
+            return False
+        self.__add_token(start, NUMBER, value)
+        return True
 
-    def __tildes(self):
-        while not self.__is_at_end():
-            c = self.__peek()
+    def __tildes(self, text:str, start:int) -> bool:
+        self.__add_token(start, LENGTH_EXT, len(text))
+        return True
 
-            if c != '~':
-                break
+    def __single_char(self, text:str, start:int) -> bool:
+        c = ord(text)
+        token_type = _CHAR_TOKEN_TYPES[c]
+        if token_type == _NOT_A_CHAR_TOKEN:
+            return self.__unrecognized(text, start)
+        self.__add_token(start, token_type, _CHAR_TOKEN_VALUES[c])
+        return True
 
-            self.__advance()
+    def __unrecognized(self, text:str, start:int) -> bool:
+        self.error_msg = f"Unrecognized character at {self.__script_index(start)}: \'{text}\'"
+        return False
 
-        self.__add_token(LENGTH_EXT, len(self.__get_substring()))
\ No newline at end of file
+    # Indexed by _TOKEN_PATTERN group number.
+    __TOKEN_HANDLERS = (
+        None,
+        __newline,      # NL
+        __number,       # NUM
+        __tildes,       # TIL
+        __single_char,  # CHAR
+        __unrecognized, # ERR
+        __skip,         # END
+    )
\ No newline at end of file